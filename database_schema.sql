@@ -6,7 +6,8 @@
 -- e-commerce data analysis project. Execute this before running Python scripts.
 --
 -- Database: ecommerce_db
--- Tables: customers, products, invoices, order_items
+-- Tables: customers, products, invoices, order_items, customer_ltv_mv,
+--         customer_ltv_mv_watermark
 -- Records: 400,916 transaction records from 4,312 customers
 -- ============================================================================
 
@@ -25,8 +26,8 @@ CREATE TABLE IF NOT EXISTS customers (
     customer_id INT PRIMARY KEY COMMENT 'Unique customer identifier',
     country VARCHAR(50) COMMENT 'Customer country',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT 'Record creation time',
-    INDEX idx_customer_id (customer_id) COMMENT 'PK lookup optimization',
-    INDEX idx_customers_country (country) COMMENT 'Geographic query optimization'
+    INDEX idx_customers_country (country) COMMENT 'Geographic query optimization',
+    INDEX idx_customers_id_country (customer_id, country) COMMENT 'Covers GROUP BY customer_id, country'
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
 COMMENT='Customer master table - 4,312 unique customers from 38 countries';
 
@@ -40,8 +41,7 @@ COMMENT='Customer master table - 4,312 unique customers from 38 countries';
 CREATE TABLE IF NOT EXISTS products (
     stock_code VARCHAR(50) PRIMARY KEY COMMENT 'Unique product code',
     description VARCHAR(255) COMMENT 'Product name/description',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT 'Record creation time',
-    INDEX idx_products_stock (stock_code) COMMENT 'Product lookup optimization'
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT 'Record creation time'
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
 COMMENT='Product catalog - 4,017 unique products';
 
@@ -64,7 +64,7 @@ CREATE TABLE IF NOT EXISTS invoices (
         REFERENCES customers(customer_id) 
         ON DELETE RESTRICT ON UPDATE CASCADE,
     
-    INDEX idx_invoice_customer (customer_id) COMMENT 'Customer-invoice join optimization',
+    INDEX idx_invoice_customer_cover (customer_id, invoice_id, invoice_date, total_amount) COMMENT 'Covering customer-invoice join',
     INDEX idx_invoice_date (invoice_date) COMMENT 'Time-series query optimization'
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
 COMMENT='Invoice master table - 19,213 unique invoices';
@@ -74,12 +74,16 @@ COMMENT='Invoice master table - 19,213 unique invoices';
 -- ============================================================================
 -- Stores line-item details for each invoice
 -- Primary key: order_item_id (auto-increment)
--- Foreign keys: invoice_id, stock_code
+-- Foreign keys: invoice_id, customer_id, stock_code
+-- customer_id and invoice_date are copied from the parent invoice so
+-- per-customer aggregates can scan order_items without joining invoices
 --
 
 CREATE TABLE IF NOT EXISTS order_items (
     order_item_id INT AUTO_INCREMENT PRIMARY KEY COMMENT 'Unique line item identifier',
     invoice_id VARCHAR(20) NOT NULL COMMENT 'Invoice reference (foreign key)',
+    customer_id INT COMMENT 'Customer ID, denormalized from invoices (foreign key)',
+    invoice_date DATETIME COMMENT 'Invoice date, denormalized from invoices',
     stock_code VARCHAR(50) NOT NULL COMMENT 'Product code (foreign key)',
     quantity INT COMMENT 'Quantity ordered',
     unit_price DECIMAL(10, 2) COMMENT 'Unit price at time of sale',
@@ -90,15 +94,53 @@ CREATE TABLE IF NOT EXISTS order_items (
         REFERENCES invoices(invoice_id) 
         ON DELETE CASCADE ON UPDATE CASCADE,
     
+    CONSTRAINT fk_order_items_customer FOREIGN KEY (customer_id) 
+        REFERENCES customers(customer_id) 
+        ON DELETE RESTRICT ON UPDATE CASCADE,
+    
     CONSTRAINT fk_order_items_product FOREIGN KEY (stock_code) 
         REFERENCES products(stock_code) 
         ON DELETE RESTRICT ON UPDATE CASCADE,
     
-    INDEX idx_order_items_invoice (invoice_id) COMMENT 'Invoice detail lookup',
+    INDEX idx_order_items_invoice_stock (invoice_id, stock_code) COMMENT 'Invoice detail lookup',
+    INDEX idx_oi_cover (invoice_id, quantity, unit_price, line_total) COMMENT 'Index-only invoice revenue sums',
+    INDEX idx_order_items_customer_cover (customer_id, invoice_id, invoice_date, line_total) COMMENT 'Index-only per-customer RFM scan',
     INDEX idx_order_items_stock (stock_code) COMMENT 'Product lookup from items'
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
 COMMENT='Order line items - 400,916 transaction records';
 
+-- ============================================================================
+-- TABLE 5: CUSTOMER_LTV_MV
+-- ============================================================================
+-- Materialized per-customer lifetime value (SUM of order_items.line_total)
+-- Primary key: customer_id
+-- Rebuilt by visualization_blue.py when MAX(order_item_id) or COUNT(*) of
+-- order_items differs from the values in customer_ltv_mv_watermark
+--
+
+CREATE TABLE IF NOT EXISTS customer_ltv_mv (
+    customer_id INT PRIMARY KEY COMMENT 'Customer ID',
+    ltv DECIMAL(12, 2) NOT NULL COMMENT 'Total spend across all order items',
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT 'Time of the refresh that wrote this row',
+    INDEX ix_ltv (ltv) COMMENT 'LTV range scans for the distribution chart'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+COMMENT='Customer LTV summary - one row per customer';
+
+-- ============================================================================
+-- TABLE 6: CUSTOMER_LTV_MV_WATERMARK
+-- ============================================================================
+-- Single row (id = 1) recording the state of order_items that
+-- customer_ltv_mv was last built from
+--
+
+CREATE TABLE IF NOT EXISTS customer_ltv_mv_watermark (
+    id TINYINT PRIMARY KEY COMMENT 'Always 1',
+    max_order_item_id INT COMMENT 'MAX(order_items.order_item_id) at the last refresh',
+    order_item_count INT NOT NULL COMMENT 'COUNT(*) of order_items at the last refresh',
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT 'Time of the last refresh'
+) ENGINE=InnoDB
+COMMENT='Refresh watermark for customer_ltv_mv';
+
 -- ============================================================================
 -- DATABASE VIEWS (Optional - for common queries)
 -- ============================================================================
@@ -247,12 +289,13 @@ DELIMITER ;
 -- These indexes are created automatically during data import,
 -- but listed here for reference
 
--- CREATE INDEX idx_customer_id ON customers(customer_id);
 -- CREATE INDEX idx_customers_country ON customers(country);
--- CREATE INDEX idx_products_stock ON products(stock_code);
--- CREATE INDEX idx_invoice_customer ON invoices(customer_id);
+-- CREATE INDEX idx_customers_id_country ON customers(customer_id, country);
+-- CREATE INDEX idx_invoice_customer_cover ON invoices(customer_id, invoice_id, invoice_date, total_amount);
 -- CREATE INDEX idx_invoice_date ON invoices(invoice_date);
--- CREATE INDEX idx_order_items_invoice ON order_items(invoice_id);
+-- CREATE INDEX idx_order_items_invoice_stock ON order_items(invoice_id, stock_code);
+-- CREATE INDEX idx_oi_cover ON order_items(invoice_id, quantity, unit_price, line_total);
+-- CREATE INDEX idx_order_items_customer_cover ON order_items(customer_id, invoice_id, invoice_date, line_total);
 -- CREATE INDEX idx_order_items_stock ON order_items(stock_code);
 
 -- ============================================================================
@@ -1,103 +1,162 @@
+import os
+import tempfile
+from itertools import islice
+from pathlib import Path
+
 import pandas as pd
+import polars as pl
 import pymysql
-import openpyxl
-from openpyxl.utils.dataframe import dataframe_to_rows
+
+
+# Insert rows in batches of `chunk` with executemany; pymysql rewrites each
+# batch into a single multi-row INSERT ... VALUES (...), (...) statement.
+# `rows` can be any iterable and is consumed lazily, so only one batch is
+# held in memory at a time.
+def bulk_insert(cursor, sql, rows, chunk=2000):
+    rows = iter(rows)
+    while batch := list(islice(rows, chunk)):
+        cursor.executemany(sql, batch)
 
 # ============================================================================
-# STEP 1: Load raw data from Excel
+# STEP 1: Load raw data from Excel (or the cleaned-data cache)
 # ============================================================================
 
 print("=" * 80)
 print("E-COMMERCE DATA IMPORT & CLEANING PIPELINE")
 print("=" * 80)
 
-print("\n[STEP 1] Loading raw data from Excel...\n")
-
-# Load the Excel file
-file_path = 'online_retail_II.xlsx'
-df = pd.read_excel(file_path)
-
-print(f"✓ Raw data loaded successfully")
-print(f"  • Total rows: {len(df):,}")
-print(f"  • Total columns: {len(df.columns)}")
-print(f"  • Columns: {', '.join(df.columns.tolist())}")
-print(f"\nFirst few rows:")
-print(df.head(10))
-
-# ============================================================================
-# STEP 2: Data cleaning
-# ============================================================================
-
-print("\n" + "=" * 80)
-print("[STEP 2] Data Cleaning...\n")
-
-# Record original counts for comparison
-original_count = len(df)
-
-# Remove rows with missing Customer ID or Description
-print("[2.1] Removing rows with missing Customer ID or Description...")
-df_clean = df.dropna(subset=['Customer ID', 'Description'])
-removed_missing = original_count - len(df_clean)
-print(f"  ✓ Removed {removed_missing:,} rows with missing values")
-print(f"    Remaining: {len(df_clean):,} rows")
-
-# Remove duplicate rows
-print("\n[2.2] Removing duplicate records...")
-before_dedup = len(df_clean)
-df_clean = df_clean.drop_duplicates()
-removed_duplicates = before_dedup - len(df_clean)
-print(f"  ✓ Removed {removed_duplicates:,} duplicate rows")
-print(f"    Remaining: {len(df_clean):,} rows")
-
-# Remove rows with invalid Quantity (≤ 0)
-print("\n[2.3] Removing rows with invalid Quantity (≤ 0)...")
-before_qty_filter = len(df_clean)
-df_clean = df_clean[df_clean['Quantity'] > 0]
-removed_invalid_qty = before_qty_filter - len(df_clean)
-print(f"  ✓ Removed {removed_invalid_qty:,} rows with invalid quantity")
-print(f"    Remaining: {len(df_clean):,} rows")
-
-# Remove rows with invalid Price (≤ 0)
-print("\n[2.4] Removing rows with invalid Price (≤ 0)...")
-before_price_filter = len(df_clean)
-df_clean = df_clean[df_clean['Price'] > 0]
-removed_invalid_price = before_price_filter - len(df_clean)
-print(f"  ✓ Removed {removed_invalid_price:,} rows with invalid price")
-print(f"    Remaining: {len(df_clean):,} rows")
-
-# Calculate total removed records
-total_removed = original_count - len(df_clean)
-quality_improvement = (total_removed / original_count) * 100
-
-print(f"\n{'─' * 80}")
-print(f"Data Quality Summary:")
-print(f"  • Original rows: {original_count:,}")
-print(f"  • Final rows: {len(df_clean):,}")
-print(f"  • Total removed: {total_removed:,}")
-print(f"  • Data quality improvement: {quality_improvement:.1f}%")
-print(f"{'─' * 80}")
-
-# ============================================================================
-# STEP 3: Prepare data for database import
-# ============================================================================
-
-print("\n" + "=" * 80)
-print("[STEP 3] Preparing data for database import...\n")
-
-# Convert InvoiceDate to datetime
-df_clean['InvoiceDate'] = pd.to_datetime(df_clean['InvoiceDate'])
-
-# Create line_total column
-df_clean['line_total'] = df_clean['Quantity'] * df_clean['Price']
-
-# Round monetary values
-df_clean['Price'] = df_clean['Price'].round(2)
-df_clean['line_total'] = df_clean['line_total'].round(2)
-
-print("✓ Data prepared for database import")
-print(f"  • Added line_total column")
-print(f"  • Standardized data types")
-print(f"  • Rounded monetary values to 2 decimals")
+# Reuse the cleaned data from a previous run when the cache is newer than the
+# source workbook, or when the workbook is not present; otherwise run Steps
+# 1-3 and refresh the cache. The cache is not keyed on the cleaning code, so
+# delete it after changing Steps 2-3
+file_path = Path('online_retail_II.xlsx')
+cache_path = Path('retail_clean.parquet')
+
+if cache_path.exists() and (
+    not file_path.exists() or cache_path.stat().st_mtime > file_path.stat().st_mtime
+):
+    print("\n[STEP 1-3] Loading cleaned data from cache...\n")
+    df_clean = pd.read_parquet(cache_path)
+    print(f"✓ Cleaned data loaded from {cache_path}")
+    print(f"  • Total rows: {len(df_clean):,}")
+else:
+    print("\n[STEP 1] Loading raw data from Excel...\n")
+
+    # Load the Excel file with polars' calamine (Rust) reader, typing each
+    # column at read time
+    df = pl.read_excel(
+        file_path,
+        engine='calamine',
+        schema_overrides={
+            'Invoice': pl.String,
+            'StockCode': pl.String,
+            'Description': pl.String,
+            'Quantity': pl.Int32,
+            'InvoiceDate': pl.Datetime,
+            'Price': pl.Float64,
+            'Customer ID': pl.Float64,
+            'Country': pl.String,
+        },
+    )
+
+    print(f"✓ Raw data loaded successfully")
+    print(f"  • Total rows: {df.height:,}")
+    print(f"  • Total columns: {df.width}")
+    print(f"  • Columns: {', '.join(df.columns)}")
+    print(f"\nFirst few rows:")
+    print(df.head(10))
+
+    # ============================================================================
+    # STEP 2: Data cleaning
+    # ============================================================================
+
+    print("\n" + "=" * 80)
+    print("[STEP 2] Data Cleaning...\n")
+
+    # Record original counts for comparison
+    original_count = df.height
+
+    # Per-filter counts for the diagnostics, computed in one pass
+    has_values = pl.col('Customer ID').is_not_null() & pl.col('Description').is_not_null()
+    # A null Quantity or Price counts as invalid, as NaN > 0 did in pandas;
+    # without fill_null the masks would be null and drop out of every count
+    valid_qty = (pl.col('Quantity') > 0).fill_null(False)
+    valid_price = (pl.col('Price') > 0).fill_null(False)
+    removed_missing, removed_invalid_qty, removed_invalid_price = df.select(
+        (~has_values).sum().alias('removed_missing'),
+        (has_values & ~valid_qty).sum().alias('removed_invalid_qty'),
+        (has_values & valid_qty & ~valid_price).sum().alias('removed_invalid_price'),
+    ).row(0)
+
+    # Steps 2 and 3 run as one lazy query, which polars fuses into a single
+    # multithreaded columnar pass; results are converted to pandas at the end
+    df_clean = (
+        df.lazy()
+        .filter(has_values & valid_qty & valid_price)
+        .with_columns(pl.col('Customer ID').cast(pl.Int64))
+        .unique(maintain_order=True)
+        # line_total is computed from the unrounded price, then both are
+        # rounded half-to-even here so every load path stores the same cents
+        .with_columns(
+            (pl.col('Quantity') * pl.col('Price')).round(2).alias('line_total'),
+            pl.col('Price').round(2),
+        )
+        .collect()
+        .to_pandas()
+    )
+    before_dedup = original_count - removed_missing - removed_invalid_qty - removed_invalid_price
+    removed_duplicates = before_dedup - len(df_clean)
+
+    # Remove rows with missing Customer ID or Description
+    print("[2.1] Removing rows with missing Customer ID or Description...")
+    print(f"  ✓ Removed {removed_missing:,} rows with missing values")
+
+    # Remove rows with invalid Quantity (≤ 0)
+    print("\n[2.2] Removing rows with invalid Quantity (≤ 0)...")
+    print(f"  ✓ Removed {removed_invalid_qty:,} rows with invalid quantity")
+
+    # Remove rows with invalid Price (≤ 0)
+    print("\n[2.3] Removing rows with invalid Price (≤ 0)...")
+    print(f"  ✓ Removed {removed_invalid_price:,} rows with invalid price")
+    print(f"    Remaining: {before_dedup:,} rows")
+
+    # Remove duplicate rows
+    print("\n[2.4] Removing duplicate records...")
+    print(f"  ✓ Removed {removed_duplicates:,} duplicate rows")
+    print(f"    Remaining: {len(df_clean):,} rows")
+
+    # Calculate total removed records
+    total_removed = original_count - len(df_clean)
+    quality_improvement = (total_removed / original_count) * 100
+
+    print(f"\n{'─' * 80}")
+    print(f"Data Quality Summary:")
+    print(f"  • Original rows: {original_count:,}")
+    print(f"  • Final rows: {len(df_clean):,}")
+    print(f"  • Total removed: {total_removed:,}")
+    print(f"  • Data quality improvement: {quality_improvement:.1f}%")
+    print(f"{'─' * 80}")
+
+    # ============================================================================
+    # STEP 3: Prepare data for database import
+    # ============================================================================
+
+    print("\n" + "=" * 80)
+    print("[STEP 3] Preparing data for database import...\n")
+
+    # Store low-cardinality string columns as categoricals; later dedup and
+    # groupby steps then hash the integer codes instead of the strings
+    for column in ['Country', 'StockCode', 'Description', 'Invoice']:
+        df_clean[column] = df_clean[column].astype('category')
+
+    print("✓ Data prepared for database import")
+    print(f"  • Added line_total column")
+    print(f"  • Standardized data types")
+    print(f"  • Rounded monetary values to 2 decimals")
+
+    # Cache the cleaned frame so re-runs skip Excel parsing entirely
+    df_clean.to_parquet(cache_path, compression='zstd')
+    print(f"  • Cached cleaned data to {cache_path}")
 
 # ============================================================================
 # STEP 4: Connect to MySQL and create schema
@@ -110,7 +169,8 @@ conn = pymysql.connect(
     host='localhost',
     user='ecommerce_user',
     password='ecommerce_password',
-    database='ecommerce_db'
+    database='ecommerce_db',
+    local_infile=True
 )
 cursor = conn.cursor()
 
@@ -164,12 +224,15 @@ create_order_items_table = """
 CREATE TABLE IF NOT EXISTS order_items (
     order_item_id INT AUTO_INCREMENT PRIMARY KEY,
     invoice_id VARCHAR(20),
+    customer_id INT,
+    invoice_date DATETIME,
     stock_code VARCHAR(50),
     quantity INT,
     unit_price DECIMAL(10, 2),
     line_total DECIMAL(12, 2),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (invoice_id) REFERENCES invoices(invoice_id),
+    FOREIGN KEY (customer_id) REFERENCES customers(customer_id),
     FOREIGN KEY (stock_code) REFERENCES products(stock_code)
 );
 """
@@ -185,81 +248,110 @@ print("✓ All tables created successfully")
 print("\n" + "=" * 80)
 print("[STEP 5] Importing data...\n")
 
-# Import unique customers
-print("[5.1] Importing customers...")
-customers = df_clean[['Customer ID', 'Country']].drop_duplicates()
-for _, row in customers.iterrows():
+# Run the whole import as one transaction with the classic bulk-load session
+# settings, so the server flushes its redo log once instead of per statement
+conn.autocommit(False)
+cursor.execute("SET unique_checks = 0")
+cursor.execute("SET foreign_key_checks = 0")
+
+try:
+    # Import unique customers
+    print("[5.1] Importing customers...")
+    # One row per customer; INSERT IGNORE would keep only the first country anyway
+    customers = df_clean.groupby('Customer ID', sort=False)['Country'].first().reset_index()
     insert_customer_sql = """
     INSERT IGNORE INTO customers (customer_id, country)
     VALUES (%s, %s)
     """
-    cursor.execute(insert_customer_sql, (int(row['Customer ID']), row['Country']))
-
-conn.commit()
-print(f"  ✓ Imported {len(customers):,} unique customers")
+    bulk_insert(cursor, insert_customer_sql, customers.itertuples(index=False, name=None))
+    print(f"  ✓ Imported {len(customers):,} unique customers")
 
-# Import unique products
-print("\n[5.2] Importing products...")
-products = df_clean[['StockCode', 'Description']].drop_duplicates()
-for _, row in products.iterrows():
+    # Import unique products
+    print("\n[5.2] Importing products...")
+    # One row per stock code, keeping its first description
+    products = df_clean.groupby('StockCode', sort=False, observed=True)['Description'].first().reset_index()
     insert_product_sql = """
     INSERT IGNORE INTO products (stock_code, description)
     VALUES (%s, %s)
     """
-    cursor.execute(insert_product_sql, (row['StockCode'], row['Description']))
+    bulk_insert(cursor, insert_product_sql, products.itertuples(index=False, name=None))
+    print(f"  ✓ Imported {len(products):,} unique products")
+
+    # Import invoices
+    print("\n[5.3] Importing invoices...")
+    # One groupby pass yields each invoice's customer, date and total amount
+    invoices = df_clean.groupby('Invoice', as_index=False, observed=True).agg(
+        customer_id=('Customer ID', 'first'),
+        invoice_date=('InvoiceDate', 'first'),
+        total_amount=('line_total', 'sum'),
+    )
 
-conn.commit()
-print(f"  ✓ Imported {len(products):,} unique products")
-
-# Import invoices
-print("\n[5.3] Importing invoices...")
-invoices = df_clean[['Invoice', 'Customer ID', 'InvoiceDate']].drop_duplicates()
-
-# Group by invoice to calculate total amount
-invoice_totals = df_clean.groupby('Invoice')['line_total'].sum().reset_index()
-invoice_totals.rename(columns={'line_total': 'total_amount'}, inplace=True)
-
-# Merge with invoice data
-invoices_merged = pd.merge(
-    invoices,
-    invoice_totals,
-    left_on='Invoice',
-    right_on='Invoice',
-    how='left'
-)
-
-for _, row in invoices_merged.iterrows():
     insert_invoice_sql = """
     INSERT IGNORE INTO invoices (invoice_id, customer_id, invoice_date, total_amount)
     VALUES (%s, %s, %s, %s)
     """
-    cursor.execute(insert_invoice_sql, (
-        row['Invoice'],
-        int(row['Customer ID']),
-        row['InvoiceDate'],
-        row['total_amount']
-    ))
-
-conn.commit()
-print(f"  ✓ Imported {len(invoices_merged):,} unique invoices")
-
-# Import order items
-print("\n[5.4] Importing order items...")
-for _, row in df_clean.iterrows():
+    bulk_insert(cursor, insert_invoice_sql, invoices.itertuples(index=False, name=None))
+    print(f"  ✓ Imported {len(invoices):,} unique invoices")
+
+    # Import order items
+    print("\n[5.4] Importing order items...")
+    # Customer and invoice date are denormalized onto each line so per-customer
+    # analyses can aggregate order_items without joining invoices. They are
+    # taken from the invoice rows above, so every line carries exactly the
+    # values stored on its invoice even when the source lines disagree
+    order_items = df_clean[['Invoice', 'StockCode', 'Quantity', 'Price', 'line_total']].merge(
+        invoices[['Invoice', 'customer_id', 'invoice_date']], on='Invoice', how='left', sort=False
+    )
+    order_item_columns = ['Invoice', 'customer_id', 'invoice_date', 'StockCode', 'Quantity', 'Price', 'line_total']
+    load_order_items_sql = """
+    LOAD DATA LOCAL INFILE %s INTO TABLE order_items
+    FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+    LINES TERMINATED BY '\\n'
+    (invoice_id, customer_id, invoice_date, stock_code, quantity, unit_price, line_total)
+    """
     insert_order_item_sql = """
-    INSERT INTO order_items (invoice_id, stock_code, quantity, unit_price, line_total)
-    VALUES (%s, %s, %s, %s, %s)
+    INSERT INTO order_items (invoice_id, customer_id, invoice_date, stock_code, quantity, unit_price, line_total)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
     """
-    cursor.execute(insert_order_item_sql, (
-        row['Invoice'],
-        row['StockCode'],
-        int(row['Quantity']),
-        row['Price'],
-        row['line_total']
-    ))
 
-conn.commit()
-print(f"  ✓ Imported {len(df_clean):,} order items")
+    # Dump the rows to a CSV file and bulk load it server-side, which skips
+    # per-row SQL parsing
+    tmp = tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', encoding='utf-8', delete=False)
+    try:
+        with tmp:
+            order_items[order_item_columns].to_csv(
+                tmp,
+                index=False,
+                header=False,
+                float_format='%.2f',
+                date_format='%Y-%m-%d %H:%M:%S',
+                lineterminator='\n'
+            )
+
+        cursor.execute("SAVEPOINT before_order_items")
+        cursor.execute(load_order_items_sql, (tmp.name,))
+    except pymysql.err.OperationalError as e:
+        # Only a server that refuses LOCAL INFILE (3948 on MySQL 8, 1148 on
+        # older servers) falls back to batched INSERTs; anything else is a
+        # real failure and aborts the import
+        if e.args[0] not in (1148, 3948):
+            raise
+        print(f"  ! LOAD DATA LOCAL INFILE unavailable ({e.args[-1]}), falling back to batched INSERTs")
+        cursor.execute("ROLLBACK TO SAVEPOINT before_order_items")
+        # Stream the rows so only one batch of tuples exists at a time
+        rows = order_items[order_item_columns].itertuples(index=False, name=None)
+        bulk_insert(cursor, insert_order_item_sql, rows)
+    finally:
+        os.remove(tmp.name)
+    print(f"  ✓ Imported {len(order_items):,} order items")
+
+    conn.commit()
+except Exception:
+    conn.rollback()
+    raise
+finally:
+    cursor.execute("SET unique_checks = 1")
+    cursor.execute("SET foreign_key_checks = 1")
 
 # ============================================================================
 # STEP 6: Create indexes for performance optimization
@@ -268,18 +360,22 @@ print(f"  ✓ Imported {len(df_clean):,} order items")
 print("\n" + "=" * 80)
 print("[STEP 6] Creating indexes for query optimization...\n")
 
+# Composite indexes match the join/group columns of the analysis queries, and
+# the covering ones let revenue sums be read from the index alone. Primary key
+# columns get no extra single-column index.
 indexes = [
-    ("idx_customer_id", "customers", "customer_id"),
-    ("idx_customers_country", "customers", "country"),
-    ("idx_invoice_customer", "invoices", "customer_id"),
-    ("idx_invoice_date", "invoices", "invoice_date"),
-    ("idx_order_items_invoice", "order_items", "invoice_id"),
-    ("idx_order_items_stock", "order_items", "stock_code"),
-    ("idx_products_stock", "products", "stock_code"),
+    ("idx_customers_country", "customers", "(country)"),
+    ("idx_customers_id_country", "customers", "(customer_id, country)"),
+    ("idx_invoice_customer_cover", "invoices", "(customer_id, invoice_id, invoice_date, total_amount)"),
+    ("idx_invoice_date", "invoices", "(invoice_date)"),
+    ("idx_order_items_invoice_stock", "order_items", "(invoice_id, stock_code)"),
+    ("idx_oi_cover", "order_items", "(invoice_id, quantity, unit_price, line_total)"),
+    ("idx_order_items_customer_cover", "order_items", "(customer_id, invoice_id, invoice_date, line_total)"),
+    ("idx_order_items_stock", "order_items", "(stock_code)"),
 ]
 
-for index_name, table_name, column_name in indexes:
-    create_index_sql = f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name}({column_name})"
+for index_name, table_name, columns in indexes:
+    create_index_sql = f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name}{columns}"
     cursor.execute(create_index_sql)
     print(f"  ✓ Created index: {index_name}")
 
@@ -311,10 +407,12 @@ print(f"  • Products: {product_count:,}")
 print(f"  • Invoices: {invoice_count:,}")
 print(f"  • Order Items: {order_item_count:,}")
 
-# Verify referential integrity
+# Verify referential integrity; foreign key checks were off during the bulk
+# load, so this anti-join (resolved on the invoice_id indexes) is still needed
 cursor.execute("""
-    SELECT COUNT(*) FROM order_items oi 
-    WHERE NOT EXISTS (SELECT 1 FROM invoices i WHERE i.invoice_id = oi.invoice_id)
+    SELECT COUNT(*) FROM order_items oi
+    LEFT JOIN invoices i USING (invoice_id)
+    WHERE i.invoice_id IS NULL
 """)
 orphaned_orders = cursor.fetchone()[0]
 print(f"\n✓ Data integrity check: {orphaned_orders} orphaned records found")
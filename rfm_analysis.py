@@ -1,86 +1,84 @@
 import pandas as pd
-import pymysql
-
-# Connect to MySQL
-conn = pymysql.connect(
-    host='localhost',
-    user='ecommerce_user',
-    password='ecommerce_password',
-    database='ecommerce_db'
+from pymysql.constants import CLIENT
+from sqlalchemy import create_engine
+from sqlalchemy.engine import URL
+
+# Pooled MySQL engine: connections are reused instead of reopened per query
+engine = create_engine(
+    URL.create(
+        'mysql+pymysql',
+        username='ecommerce_user',
+        password='ecommerce_password',
+        host='localhost',
+        database='ecommerce_db',
+        # Passed through the URL so the dialect ORs it into its own client
+        # flags (FOUND_ROWS) instead of replacing them
+        query={'client_flag': str(CLIENT.MULTI_STATEMENTS)}
+    ),
+    pool_size=10,
+    max_overflow=20,
+    pool_pre_ping=True
 )
-cursor = conn.cursor()
+conn = engine.connect()
 
 print("=" * 100)
 print("RFM CUSTOMER ANALYSIS & SEGMENTATION")
 print("=" * 100)
 
 # ============================================================================
-# STEP 1: Calculate RFM values for each customer
+# Materialize per-customer RFM values and scores once; every step below
+# reads from rfm_base. The values come from a single scan of order_items,
+# which carries customer_id, invoice_date and line_total per line. rfm_base is
+# a TEMPORARY table, private to this connection; each query below reads it
+# only once, so MySQL's one-reference limit on temporary tables is not hit
 # ============================================================================
 
-print("\n[STEP 1] Calculating RFM values for each customer...\n")
-
-rfm_query = """
-WITH customer_rfm AS (
+rfm_base_query = """
+CREATE TEMPORARY TABLE rfm_base (
+    PRIMARY KEY (customer_id),
+    INDEX idx_rfm_base_monetary (monetary)
+)
+SELECT 
+    customer_id,
+    country,
+    days_active,
+    recency,
+    frequency,
+    monetary,
+    NTILE(4) OVER (ORDER BY recency DESC) AS r_score,
+    NTILE(4) OVER (ORDER BY frequency) AS f_score,
+    NTILE(4) OVER (ORDER BY monetary) AS m_score
+FROM (
     SELECT 
-        c.customer_id,
-        c.country,
-        DATEDIFF(MAX(i.invoice_date), MIN(i.invoice_date)) AS days_active,
-        DATEDIFF('2011-12-09', MAX(i.invoice_date)) AS recency,
-        COUNT(DISTINCT i.invoice_id) AS frequency,
-        ROUND(SUM(oi.quantity * oi.unit_price), 2) AS monetary
-    FROM customers c
-    LEFT JOIN invoices i ON c.customer_id = i.customer_id
-    LEFT JOIN order_items oi ON i.invoice_id = oi.invoice_id
-    GROUP BY c.customer_id, c.country
+        customer_id,
+        DATEDIFF(MAX(invoice_date), MIN(invoice_date)) AS days_active,
+        DATEDIFF('2011-12-09', MAX(invoice_date)) AS recency,
+        COUNT(DISTINCT invoice_id) AS frequency,
+        ROUND(SUM(line_total), 2) AS monetary
+    FROM order_items
+    GROUP BY customer_id
     HAVING monetary > 0
-)
-SELECT * FROM customer_rfm
-ORDER BY monetary DESC
-LIMIT 20;
+) customer_rfm
+JOIN customers USING (customer_id);
 """
 
-cursor.execute(rfm_query)
-rfm_data = cursor.fetchall()
-print("Top 20 customers by RFM metrics:")
-print(f"{'Customer ID':<12} {'Country':<15} {'Days Active':<12} {'Recency':<10} {'Frequency':<12} {'Monetary':<15}")
-print("-" * 80)
-for row in rfm_data:
-    print(f"{row[0]:<12.0f} {row[1]:<15} {row[2]:<12} {row[3]:<10} {row[4]:<12} ${row[5]:<14.2f}")
+conn.exec_driver_sql(rfm_base_query)
 
 # ============================================================================
-# STEP 2: RFM Scoring (1-4 scale)
+# Analysis queries: all six SELECTs are sent to MySQL as one multi-statement
+# batch, so the steps below cost a single round trip
 # ============================================================================
 
-print("\n" + "=" * 100)
-print("[STEP 2] Scoring RFM values using NTILE partitioning (1-4 scale)...\n")
+# Step 1: top 20 customers by RFM values
+rfm_query = """
+SELECT customer_id, country, days_active, recency, frequency, monetary
+FROM rfm_base
+ORDER BY monetary DESC
+LIMIT 20;
+"""
 
+# Step 2: top 20 customers with their NTILE scores
 rfm_segment_query = """
-WITH customer_rfm AS (
-    SELECT 
-        c.customer_id,
-        c.country,
-        DATEDIFF('2011-12-09', MAX(i.invoice_date)) AS recency,
-        COUNT(DISTINCT i.invoice_id) AS frequency,
-        ROUND(SUM(oi.quantity * oi.unit_price), 2) AS monetary
-    FROM customers c
-    LEFT JOIN invoices i ON c.customer_id = i.customer_id
-    LEFT JOIN order_items oi ON i.invoice_id = oi.invoice_id
-    GROUP BY c.customer_id, c.country
-    HAVING monetary > 0
-),
-rfm_scores AS (
-    SELECT 
-        customer_id,
-        country,
-        recency,
-        frequency,
-        monetary,
-        NTILE(4) OVER (ORDER BY recency DESC) AS r_score,
-        NTILE(4) OVER (ORDER BY frequency) AS f_score,
-        NTILE(4) OVER (ORDER BY monetary) AS m_score
-    FROM customer_rfm
-)
 SELECT 
     customer_id,
     country,
@@ -91,53 +89,14 @@ SELECT
     f_score,
     m_score,
     CONCAT(r_score, f_score, m_score) AS rfm_segment
-FROM rfm_scores
+FROM rfm_base
 ORDER BY monetary DESC
 LIMIT 20;
 """
 
-cursor.execute(rfm_segment_query)
-rfm_segment_data = cursor.fetchall()
-print("Top 20 customers with RFM scores:")
-print(f"{'Customer':<10} {'Recency':<10} {'Freq':<6} {'Monetary':<12} {'R':<3} {'F':<3} {'M':<3} {'Segment':<10}")
-print("-" * 70)
-for row in rfm_segment_data:
-    print(f"{row[0]:<10.0f} {row[2]:<10} {row[3]:<6} ${row[4]:<11.2f} {row[5]:<3} {row[6]:<3} {row[7]:<3} {row[8]:<10}")
-
-# ============================================================================
-# STEP 3: Customer Segmentation
-# ============================================================================
-
-print("\n" + "=" * 100)
-print("[STEP 3] Customer segmentation by value tier...\n")
-
+# Step 3: customer count and average spend per value tier
 customer_segment_query = """
-WITH customer_rfm AS (
-    SELECT 
-        c.customer_id,
-        c.country,
-        DATEDIFF('2011-12-09', MAX(i.invoice_date)) AS recency,
-        COUNT(DISTINCT i.invoice_id) AS frequency,
-        ROUND(SUM(oi.quantity * oi.unit_price), 2) AS monetary
-    FROM customers c
-    LEFT JOIN invoices i ON c.customer_id = i.customer_id
-    LEFT JOIN order_items oi ON i.invoice_id = oi.invoice_id
-    GROUP BY c.customer_id, c.country
-    HAVING monetary > 0
-),
-rfm_scores AS (
-    SELECT 
-        customer_id,
-        country,
-        recency,
-        frequency,
-        monetary,
-        NTILE(4) OVER (ORDER BY recency DESC) AS r_score,
-        NTILE(4) OVER (ORDER BY frequency) AS f_score,
-        NTILE(4) OVER (ORDER BY monetary) AS m_score
-    FROM customer_rfm
-),
-customer_segments AS (
+WITH customer_segments AS (
     SELECT 
         customer_id,
         country,
@@ -152,7 +111,7 @@ customer_segments AS (
             WHEN r_score = 1 AND f_score <= 2 AND m_score <= 2 THEN 'At-Risk'
             ELSE 'Other'
         END AS segment
-    FROM rfm_scores
+    FROM rfm_base
 )
 SELECT segment, COUNT(*) AS count, ROUND(AVG(monetary), 2) AS avg_monetary
 FROM customer_segments
@@ -160,47 +119,8 @@ GROUP BY segment
 ORDER BY avg_monetary DESC;
 """
 
-cursor.execute(customer_segment_query)
-segment_data = cursor.fetchall()
-print("Customer segmentation summary:")
-print(f"{'Segment':<15} {'Count':<10} {'Avg Monetary':<20}")
-print("-" * 50)
-for row in segment_data:
-    print(f"{row[0]:<15} {row[1]:<10} ${row[2]:<19.2f}")
-
-# ============================================================================
-# STEP 4: Top-Tier & High-Value Customers
-# ============================================================================
-
-print("\n" + "=" * 100)
-print("[STEP 4] Detailed analysis of top-tier and high-value customers...\n")
-
+# Step 4: top-tier and high-value customers
 top_customers_query = """
-WITH customer_rfm AS (
-    SELECT 
-        c.customer_id,
-        c.country,
-        DATEDIFF('2011-12-09', MAX(i.invoice_date)) AS recency,
-        COUNT(DISTINCT i.invoice_id) AS frequency,
-        ROUND(SUM(oi.quantity * oi.unit_price), 2) AS monetary
-    FROM customers c
-    LEFT JOIN invoices i ON c.customer_id = i.customer_id
-    LEFT JOIN order_items oi ON i.invoice_id = oi.invoice_id
-    GROUP BY c.customer_id, c.country
-    HAVING monetary > 0
-),
-rfm_scores AS (
-    SELECT 
-        customer_id,
-        country,
-        recency,
-        frequency,
-        monetary,
-        NTILE(4) OVER (ORDER BY recency DESC) AS r_score,
-        NTILE(4) OVER (ORDER BY frequency) AS f_score,
-        NTILE(4) OVER (ORDER BY monetary) AS m_score
-    FROM customer_rfm
-)
 SELECT 
     customer_id,
     country,
@@ -211,15 +131,113 @@ SELECT
         WHEN r_score = 4 AND f_score = 4 AND m_score = 4 THEN 'Top-Tier'
         WHEN r_score >= 3 AND f_score >= 3 AND m_score >= 3 THEN 'High-Value'
     END AS customer_tier
-FROM rfm_scores
+FROM rfm_base
 WHERE (r_score = 4 AND f_score = 4 AND m_score = 4) 
    OR (r_score >= 3 AND f_score >= 3 AND m_score >= 3)
 ORDER BY monetary DESC
 LIMIT 20;
 """
 
-cursor.execute(top_customers_query)
-top_customers = cursor.fetchall()
+# Step 5: overall KPIs
+kpi_query = """
+SELECT 
+    COUNT(DISTINCT customer_id) AS total_customers,
+    ROUND(AVG(frequency), 2) AS avg_purchase_frequency,
+    ROUND(AVG(monetary), 2) AS avg_customer_ltv,
+    ROUND(SUM(monetary), 2) AS total_revenue,
+    MAX(monetary) AS top_customer_spending,
+    MIN(monetary) AS min_customer_spending
+FROM rfm_base;
+"""
+
+# Step 6: share of revenue from the top 20% of customers
+pareto_query = """
+WITH ranked_customers AS (
+    SELECT 
+        monetary,
+        ROW_NUMBER() OVER (ORDER BY monetary DESC) AS revenue_rank,
+        COUNT(*) OVER () AS customer_count
+    FROM rfm_base
+),
+pareto AS (
+    SELECT 
+        COUNT(*) AS total_customers,
+        SUM(monetary) AS total_revenue,
+        SUM(revenue_rank <= CEIL(customer_count * 0.2)) AS top_customers,
+        SUM(CASE WHEN revenue_rank <= CEIL(customer_count * 0.2) THEN monetary ELSE 0 END) AS top_revenue
+    FROM ranked_customers
+)
+SELECT 
+    total_customers,
+    total_revenue,
+    top_customers,
+    top_revenue,
+    ROUND((top_customers / total_customers) * 100, 1) AS top_pct_of_customers,
+    ROUND((top_revenue / total_revenue) * 100, 1) AS top_pct_of_revenue
+FROM pareto;
+"""
+
+cursor = conn.connection.cursor()
+cursor.execute("\n".join([
+    rfm_query,
+    rfm_segment_query,
+    customer_segment_query,
+    top_customers_query,
+    kpi_query,
+    pareto_query,
+]))
+results = [cursor.fetchall()]
+while cursor.nextset():
+    results.append(cursor.fetchall())
+cursor.close()
+
+rfm_data, rfm_segment_data, segment_data, top_customers, (kpi_data,), (pareto_data,) = results
+
+# ============================================================================
+# STEP 1: Calculate RFM values for each customer
+# ============================================================================
+
+print("\n[STEP 1] Calculating RFM values for each customer...\n")
+
+print("Top 20 customers by RFM metrics:")
+print(f"{'Customer ID':<12} {'Country':<15} {'Days Active':<12} {'Recency':<10} {'Frequency':<12} {'Monetary':<15}")
+print("-" * 80)
+for row in rfm_data:
+    print(f"{row[0]:<12.0f} {row[1]:<15} {row[2]:<12} {row[3]:<10} {row[4]:<12} ${row[5]:<14.2f}")
+
+# ============================================================================
+# STEP 2: RFM Scoring (1-4 scale)
+# ============================================================================
+
+print("\n" + "=" * 100)
+print("[STEP 2] Scoring RFM values using NTILE partitioning (1-4 scale)...\n")
+
+print("Top 20 customers with RFM scores:")
+print(f"{'Customer':<10} {'Recency':<10} {'Freq':<6} {'Monetary':<12} {'R':<3} {'F':<3} {'M':<3} {'Segment':<10}")
+print("-" * 70)
+for row in rfm_segment_data:
+    print(f"{row[0]:<10.0f} {row[2]:<10} {row[3]:<6} ${row[4]:<11.2f} {row[5]:<3} {row[6]:<3} {row[7]:<3} {row[8]:<10}")
+
+# ============================================================================
+# STEP 3: Customer Segmentation
+# ============================================================================
+
+print("\n" + "=" * 100)
+print("[STEP 3] Customer segmentation by value tier...\n")
+
+print("Customer segmentation summary:")
+print(f"{'Segment':<15} {'Count':<10} {'Avg Monetary':<20}")
+print("-" * 50)
+for row in segment_data:
+    print(f"{row[0]:<15} {row[1]:<10} ${row[2]:<19.2f}")
+
+# ============================================================================
+# STEP 4: Top-Tier & High-Value Customers
+# ============================================================================
+
+print("\n" + "=" * 100)
+print("[STEP 4] Detailed analysis of top-tier and high-value customers...\n")
+
 print("Top-tier and high-value customers (top 20):")
 print(f"{'Customer ID':<12} {'Country':<15} {'Recency':<10} {'Frequency':<12} {'Monetary':<15} {'Tier':<12}")
 print("-" * 80)
@@ -234,31 +252,6 @@ for row in top_customers:
 print("\n" + "=" * 100)
 print("[STEP 5] Key Performance Indicators (KPIs)...\n")
 
-kpi_query = """
-WITH customer_rfm AS (
-    SELECT 
-        c.customer_id,
-        DATEDIFF('2011-12-09', MAX(i.invoice_date)) AS recency,
-        COUNT(DISTINCT i.invoice_id) AS frequency,
-        ROUND(SUM(oi.quantity * oi.unit_price), 2) AS monetary
-    FROM customers c
-    LEFT JOIN invoices i ON c.customer_id = i.customer_id
-    LEFT JOIN order_items oi ON i.invoice_id = oi.invoice_id
-    GROUP BY c.customer_id
-    HAVING monetary > 0
-)
-SELECT 
-    COUNT(DISTINCT customer_id) AS total_customers,
-    ROUND(AVG(frequency), 2) AS avg_purchase_frequency,
-    ROUND(AVG(monetary), 2) AS avg_customer_ltv,
-    ROUND(SUM(monetary), 2) AS total_revenue,
-    MAX(monetary) AS top_customer_spending,
-    MIN(monetary) AS min_customer_spending
-FROM customer_rfm;
-"""
-
-cursor.execute(kpi_query)
-kpi_data = cursor.fetchone()
 print("Key Business Metrics:")
 print(f"  • Total Customers: {kpi_data[0]:,}")
 print(f"  • Average Purchase Frequency: {kpi_data[1]:.2f} transactions")
@@ -274,46 +267,6 @@ print(f"  • Lowest Customer Spending: ${kpi_data[5]:.2f}")
 print("\n" + "=" * 100)
 print("[STEP 6] 80/20 Pareto Analysis (top customers vs total revenue)...\n")
 
-pareto_query = """
-WITH customer_rfm AS (
-    SELECT 
-        c.customer_id,
-        ROUND(SUM(oi.quantity * oi.unit_price), 2) AS monetary
-    FROM customers c
-    LEFT JOIN invoices i ON c.customer_id = i.customer_id
-    LEFT JOIN order_items oi ON i.invoice_id = oi.invoice_id
-    GROUP BY c.customer_id
-    HAVING monetary > 0
-),
-total_stats AS (
-    SELECT 
-        COUNT(*) AS total_customers,
-        SUM(monetary) AS total_revenue
-    FROM customer_rfm
-),
-top_20_percent AS (
-    SELECT 
-        COUNT(*) AS top_customers,
-        SUM(monetary) AS top_revenue
-    FROM (
-        SELECT customer_id, monetary
-        FROM customer_rfm
-        ORDER BY monetary DESC
-        LIMIT (SELECT CEIL(COUNT(*) * 0.2) FROM customer_rfm)
-    ) t
-)
-SELECT 
-    ts.total_customers,
-    ts.total_revenue,
-    t2.top_customers,
-    t2.top_revenue,
-    ROUND((t2.top_customers / ts.total_customers) * 100, 1) AS top_pct_of_customers,
-    ROUND((t2.top_revenue / ts.total_revenue) * 100, 1) AS top_pct_of_revenue
-FROM total_stats ts, top_20_percent t2;
-"""
-
-cursor.execute(pareto_query)
-pareto_data = cursor.fetchone()
 print("Pareto Analysis Results:")
 print(f"  • Total Customers: {pareto_data[0]:,}")
 print(f"  • Total Revenue: ${pareto_data[1]:,.2f}")
@@ -327,5 +280,6 @@ print("RFM ANALYSIS COMPLETED SUCCESSFULLY!")
 print("=" * 100)
 
 # Close connection
-cursor.close()
+conn.exec_driver_sql("DROP TEMPORARY TABLE rfm_base")
 conn.close()
+engine.dispose()
@@ -1,15 +1,29 @@
-import pymysql
+import gzip
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
+import plotly.io as pio
+from plotly.offline import get_plotlyjs_version
 from plotly.subplots import make_subplots
-
-# Connect to MySQL
-conn = pymysql.connect(
-    host='localhost',
-    user='ecommerce_user',
-    password='ecommerce_password',
-    database='ecommerce_db'
+from sqlalchemy import create_engine
+from sqlalchemy.engine import URL
+
+# Pooled MySQL engine: connections are reused instead of reopened per query
+engine = create_engine(
+    URL.create(
+        'mysql+pymysql',
+        username='ecommerce_user',
+        password='ecommerce_password',
+        host='localhost',
+        database='ecommerce_db'
+    ),
+    pool_size=10,
+    max_overflow=20,
+    pool_pre_ping=True
 )
 
 print("=" * 80)
@@ -17,10 +31,70 @@ print("GENERATING VERSION A: CORPORATE BLUE PROFESSIONAL DASHBOARD")
 print("=" * 80)
 
 # ============================================================================
-# 1. RFM Customer Segmentation
+# Refresh Customer LTV Summary Table
 # ============================================================================
 
-print("\n[1/6] Generating RFM scatter plot...")
+print("\nChecking customer LTV summary table...")
+
+# Per-customer LTV is kept in customer_ltv_mv between runs. The watermark
+# table records MAX(order_item_id) and COUNT(*) of order_items as they were
+# read at the last refresh; the summary is rebuilt whenever either differs,
+# which catches appended, reloaded and deleted rows alike. Otherwise the
+# dashboard reads it without re-aggregating order_items
+ltv_summary_ddl = """
+CREATE TABLE IF NOT EXISTS customer_ltv_mv (
+    customer_id INT PRIMARY KEY,
+    ltv DECIMAL(12, 2) NOT NULL,
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_ltv (ltv)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+"""
+
+ltv_watermark_ddl = """
+CREATE TABLE IF NOT EXISTS customer_ltv_mv_watermark (
+    id TINYINT PRIMARY KEY,
+    max_order_item_id INT,
+    order_item_count INT NOT NULL,
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB
+"""
+
+ltv_source_watermark_query = "SELECT MAX(order_item_id), COUNT(*) FROM order_items"
+
+ltv_summary_refresh = """
+INSERT INTO customer_ltv_mv (customer_id, ltv)
+SELECT 
+    customer_id,
+    ROUND(SUM(line_total), 2)
+FROM order_items
+WHERE customer_id IS NOT NULL
+GROUP BY customer_id
+"""
+
+with engine.begin() as conn:
+    conn.exec_driver_sql(ltv_summary_ddl)
+    conn.exec_driver_sql(ltv_watermark_ddl)
+    source_watermark = tuple(conn.exec_driver_sql(ltv_source_watermark_query).one())
+    stored_watermark = conn.exec_driver_sql(
+        "SELECT max_order_item_id, order_item_count FROM customer_ltv_mv_watermark WHERE id = 1"
+    ).first()
+    if stored_watermark is None or tuple(stored_watermark) != source_watermark:
+        # Rebuilt rather than upserted so customers removed by a re-import
+        # drop out as well. The watermark read before the rebuild is stored,
+        # so rows committed meanwhile make the next run refresh again
+        conn.exec_driver_sql("DELETE FROM customer_ltv_mv")
+        conn.exec_driver_sql(ltv_summary_refresh)
+        conn.exec_driver_sql(
+            "REPLACE INTO customer_ltv_mv_watermark (id, max_order_item_id, order_item_count) VALUES (1, %s, %s)",
+            source_watermark
+        )
+        print("✓ customer_ltv_mv refreshed")
+    else:
+        print("✓ customer_ltv_mv is up to date")
+
+# ============================================================================
+# Chart Queries
+# ============================================================================
 
 rfm_query = """
 WITH customer_rfm AS (
@@ -64,8 +138,144 @@ customer_segments AS (
 SELECT * FROM customer_segments;
 """
 
-rfm_df = pd.read_sql(rfm_query, conn)
+products_query = """
+SELECT 
+    p.description,
+    ROUND(SUM(oi.quantity * oi.unit_price), 2) AS total_revenue,
+    SUM(oi.quantity) AS total_quantity
+FROM order_items oi
+JOIN products p ON oi.stock_code = p.stock_code
+GROUP BY p.stock_code, p.description
+ORDER BY total_revenue DESC
+LIMIT 15;
+"""
+
+country_query = """
+SELECT 
+    c.country,
+    ROUND(SUM(oi.quantity * oi.unit_price), 2) AS total_revenue,
+    COUNT(DISTINCT c.customer_id) AS customer_count
+FROM customers c
+JOIN invoices i ON c.customer_id = i.customer_id
+JOIN order_items oi ON i.invoice_id = oi.invoice_id
+GROUP BY c.country
+ORDER BY total_revenue DESC
+LIMIT 15;
+"""
+
+monthly_query = """
+SELECT 
+    DATE_FORMAT(i.invoice_date, '%%Y-%%m') AS month,
+    ROUND(SUM(oi.quantity * oi.unit_price), 2) AS monthly_revenue
+FROM invoices i
+JOIN order_items oi ON i.invoice_id = oi.invoice_id
+GROUP BY DATE_FORMAT(i.invoice_date, '%%Y-%%m')
+ORDER BY month;
+"""
+
+price_query = """
+SELECT 
+    p.description,
+    ROUND(AVG(oi.unit_price), 2) AS avg_price,
+    SUM(oi.quantity) AS quantity_sold
+FROM order_items oi
+JOIN products p ON oi.stock_code = p.stock_code
+GROUP BY p.stock_code, p.description
+ORDER BY quantity_sold DESC
+LIMIT 20;
+"""
+
+# Per-customer LTV is read from the customer_ltv_mv summary table (range scan
+# on ix_ltv). The 50 equal-width bins are counted in MySQL as well, so only
+# one row per bin comes back. When every LTV is equal the width falls back to 1,
+# so the bin division never divides by zero and returns a NULL bin
+ltv_bins_query = """
+WITH customer_ltv AS (
+    SELECT 
+        customer_id,
+        ltv AS customer_ltv
+    FROM customer_ltv_mv
+    WHERE ltv > 0
+),
+bounds AS (
+    SELECT 
+        MIN(customer_ltv) AS min_ltv,
+        COALESCE(NULLIF((MAX(customer_ltv) - MIN(customer_ltv)) / 50, 0), 1) AS bin_width
+    FROM customer_ltv
+)
+SELECT 
+    CAST(LEAST(FLOOR((l.customer_ltv - b.min_ltv) / b.bin_width), 49) AS SIGNED) AS bin,
+    COUNT(*) AS customers,
+    b.min_ltv,
+    b.bin_width
+FROM customer_ltv l
+CROSS JOIN bounds b
+GROUP BY bin, b.min_ltv, b.bin_width
+ORDER BY bin
+"""
+
+# ============================================================================
+# Load Chart Data
+# ============================================================================
+
+print("\nRunning chart queries...")
+
+
+def read_rfm(query):
+    # One row per customer: a server-side cursor (stream_results) hands the
+    # rows over in 10k-row chunks instead of buffering the whole result, and
+    # each chunk's day/invoice counts are downcast to int32. monetary stays
+    # float64, since float32 cannot hold cents for the largest customers
+    rfm_dtypes = {'recency': 'int32', 'frequency': 'int32', 'monetary': 'float64'}
+    with engine.connect().execution_options(stream_results=True) as conn:
+        chunks = pd.read_sql(query, conn, chunksize=10000)
+        return pd.concat([chunk.astype(rfm_dtypes) for chunk in chunks], ignore_index=True)
+
+
+# The six queries are independent, so they run side by side. Each pd.read_sql
+# call checks out its own connection from the engine pool
+with ThreadPoolExecutor(max_workers=6) as executor:
+    futures = [
+        executor.submit(read_rfm, rfm_query),
+        executor.submit(pd.read_sql, products_query, engine),
+        executor.submit(pd.read_sql, country_query, engine),
+        executor.submit(pd.read_sql, monthly_query, engine),
+        executor.submit(pd.read_sql, price_query, engine),
+        # Arrow-backed columns keep the DECIMAL bin bounds in one buffer
+        # instead of an object column of Python Decimals
+        executor.submit(pd.read_sql, ltv_bins_query, engine, dtype_backend='pyarrow')
+    ]
+    rfm_df, products_df, country_df, monthly_df, price_df, ltv_bins = [f.result() for f in futures]
+
+print("✓ Chart data loaded")
+
+# ============================================================================
+# Shared Chart Style
+# ============================================================================
+
+# Corporate blue styling shared by all six charts, layered on plotly_white.
+# Each chart only sets its height and whatever differs from this template
+pio.templates['corporate_blue'] = go.layout.Template(
+    layout=dict(
+        font=dict(family="Segoe UI, Arial", size=11, color="#333333"),
+        title_font_size=16,
+        title_x=0.0,
+        margin=dict(l=80, r=40, t=60, b=60),
+        plot_bgcolor='#f8f9fa',
+        paper_bgcolor='white',
+        xaxis=dict(gridcolor='#e6e6e6', showgrid=True),
+        yaxis=dict(gridcolor='#e6e6e6', showgrid=True)
+    )
+)
+pio.templates.default = 'plotly_white+corporate_blue'
+
+# ============================================================================
+# 1. RFM Customer Segmentation
+# ============================================================================
+
+print("[1/6] Generating RFM scatter plot...")
 
+# One marker per customer, drawn as a WebGL (scattergl) trace instead of SVG
 fig_rfm = px.scatter(
     rfm_df,
     x='frequency',
@@ -75,6 +285,7 @@ fig_rfm = px.scatter(
     hover_name='customer_id',
     hover_data={'customer_id': ':.0f', 'recency': ':.0f', 'frequency': ':.0f', 'monetary': ':.2f', 'segment': True},
     title='Customer Lifetime Value by Purchase Frequency',
+    render_mode='webgl',
     labels={'frequency': 'Purchase Frequency', 'monetary': 'Total Spending ($)', 'segment': 'Segment'},
     color_discrete_map={
         'Top-Tier': '#003f87',
@@ -87,17 +298,8 @@ fig_rfm = px.scatter(
 
 fig_rfm.update_layout(
     height=600,
-    template='plotly_white',
-    font=dict(family="Segoe UI, Arial", size=11, color="#333333"),
     hovermode='closest',
-    showlegend=True,
-    title_font_size=16,
-    title_x=0.0,
-    margin=dict(l=80, r=40, t=60, b=60),
-    plot_bgcolor='#f8f9fa',
-    paper_bgcolor='white',
-    xaxis=dict(gridcolor='#e6e6e6', showgrid=True),
-    yaxis=dict(gridcolor='#e6e6e6', showgrid=True)
+    showlegend=True
 )
 
 fig_rfm.update_traces(marker=dict(line=dict(width=0.5, color='white')))
@@ -108,20 +310,6 @@ fig_rfm.update_traces(marker=dict(line=dict(width=0.5, color='white')))
 
 print("[2/6] Generating top products chart...")
 
-products_query = """
-SELECT 
-    p.description,
-    ROUND(SUM(oi.quantity * oi.unit_price), 2) AS total_revenue,
-    SUM(oi.quantity) AS total_quantity
-FROM order_items oi
-JOIN products p ON oi.stock_code = p.stock_code
-GROUP BY p.stock_code, p.description
-ORDER BY total_revenue DESC
-LIMIT 15;
-"""
-
-products_df = pd.read_sql(products_query, conn)
-
 fig_products = px.bar(
     products_df.sort_values('total_revenue'),
     y='description',
@@ -135,16 +323,10 @@ fig_products = px.bar(
 
 fig_products.update_layout(
     height=500,
-    template='plotly_white',
-    font=dict(family="Segoe UI, Arial", size=10, color="#333333"),
+    font_size=10,
     showlegend=False,
-    title_font_size=16,
-    title_x=0.0,
-    margin=dict(l=250, r=40, t=60, b=40),
-    plot_bgcolor='#f8f9fa',
-    paper_bgcolor='white',
-    xaxis=dict(gridcolor='#e6e6e6', showgrid=True),
-    yaxis=dict(showgrid=False)
+    margin=dict(l=250, b=40),
+    yaxis_showgrid=False
 )
 
 fig_products.update_traces(marker_color='#0066cc', marker_line=dict(width=0))
@@ -155,21 +337,6 @@ fig_products.update_traces(marker_color='#0066cc', marker_line=dict(width=0))
 
 print("[3/6] Generating geographic chart...")
 
-country_query = """
-SELECT 
-    c.country,
-    ROUND(SUM(oi.quantity * oi.unit_price), 2) AS total_revenue,
-    COUNT(DISTINCT c.customer_id) AS customer_count
-FROM customers c
-JOIN invoices i ON c.customer_id = i.customer_id
-JOIN order_items oi ON i.invoice_id = oi.invoice_id
-GROUP BY c.country
-ORDER BY total_revenue DESC
-LIMIT 15;
-"""
-
-country_df = pd.read_sql(country_query, conn)
-
 fig_country = px.pie(
     country_df,
     names='country',
@@ -180,12 +347,7 @@ fig_country = px.pie(
 
 fig_country.update_layout(
     height=600,
-    template='plotly_white',
-    font=dict(family="Segoe UI, Arial", size=11, color="#333333"),
-    title_font_size=16,
-    title_x=0.0,
-    margin=dict(l=20, r=20, t=60, b=20),
-    paper_bgcolor='white'
+    margin=dict(l=20, r=20, b=20)
 )
 
 fig_country.update_traces(
@@ -200,18 +362,6 @@ fig_country.update_traces(
 
 print("[4/6] Generating monthly trend chart...")
 
-monthly_query = """
-SELECT 
-    DATE_FORMAT(i.invoice_date, '%Y-%m') AS month,
-    ROUND(SUM(oi.quantity * oi.unit_price), 2) AS monthly_revenue
-FROM invoices i
-JOIN order_items oi ON i.invoice_id = oi.invoice_id
-GROUP BY DATE_FORMAT(i.invoice_date, '%Y-%m')
-ORDER BY month;
-"""
-
-monthly_df = pd.read_sql(monthly_query, conn)
-
 fig_monthly = px.line(
     monthly_df,
     x='month',
@@ -223,16 +373,7 @@ fig_monthly = px.line(
 
 fig_monthly.update_layout(
     height=500,
-    template='plotly_white',
-    font=dict(family="Segoe UI, Arial", size=11, color="#333333"),
-    hovermode='x unified',
-    title_font_size=16,
-    title_x=0.0,
-    margin=dict(l=80, r=40, t=60, b=60),
-    plot_bgcolor='#f8f9fa',
-    paper_bgcolor='white',
-    xaxis=dict(gridcolor='#e6e6e6', showgrid=True),
-    yaxis=dict(gridcolor='#e6e6e6', showgrid=True)
+    hovermode='x unified'
 )
 
 fig_monthly.update_traces(
@@ -246,20 +387,6 @@ fig_monthly.update_traces(
 
 print("[5/6] Generating price-volume scatter plot...")
 
-price_query = """
-SELECT 
-    p.description,
-    ROUND(AVG(oi.unit_price), 2) AS avg_price,
-    SUM(oi.quantity) AS quantity_sold
-FROM order_items oi
-JOIN products p ON oi.stock_code = p.stock_code
-GROUP BY p.stock_code, p.description
-ORDER BY quantity_sold DESC
-LIMIT 20;
-"""
-
-price_df = pd.read_sql(price_query, conn)
-
 fig_price = px.scatter(
     price_df,
     x='avg_price',
@@ -267,6 +394,7 @@ fig_price = px.scatter(
     size='quantity_sold',
     hover_name='description',
     title='Product Performance: Price vs Sales Volume',
+    render_mode='webgl',
     labels={'avg_price': 'Average Price ($)', 'quantity_sold': 'Units Sold'},
     color='avg_price',
     color_continuous_scale=['#87ceeb', '#003f87']
@@ -274,15 +402,6 @@ fig_price = px.scatter(
 
 fig_price.update_layout(
     height=600,
-    template='plotly_white',
-    font=dict(family="Segoe UI, Arial", size=11, color="#333333"),
-    title_font_size=16,
-    title_x=0.0,
-    margin=dict(l=80, r=40, t=60, b=60),
-    plot_bgcolor='#f8f9fa',
-    paper_bgcolor='white',
-    xaxis=dict(gridcolor='#e6e6e6', showgrid=True),
-    yaxis=dict(gridcolor='#e6e6e6', showgrid=True),
     hovermode='closest'
 )
 
@@ -294,58 +413,69 @@ fig_price.update_traces(marker=dict(line=dict(width=0.5, color='white')))
 
 print("[6/6] Generating LTV distribution chart...")
 
-ltv_query = """
-SELECT 
-    ROUND(SUM(oi.quantity * oi.unit_price), 2) AS customer_ltv
-FROM customers c
-LEFT JOIN invoices i ON c.customer_id = i.customer_id
-LEFT JOIN order_items oi ON i.invoice_id = oi.invoice_id
-WHERE c.customer_id IS NOT NULL
-GROUP BY c.customer_id
-HAVING customer_ltv > 0;
-"""
-
-ltv_df = pd.read_sql(ltv_query, conn)
-
-fig_ltv = px.histogram(
-    ltv_df,
-    x='customer_ltv',
-    nbins=50,
-    title='Customer Lifetime Value Distribution',
-    labels={'customer_ltv': 'Customer LTV ($)'},
-    color_discrete_sequence=['#0066cc']
-)
-
-fig_ltv.update_layout(
-    height=500,
-    template='plotly_white',
-    font=dict(family="Segoe UI, Arial", size=11, color="#333333"),
-    title_font_size=16,
-    title_x=0.0,
-    margin=dict(l=80, r=40, t=60, b=60),
-    plot_bgcolor='#f8f9fa',
-    paper_bgcolor='white',
-    xaxis=dict(gridcolor='#e6e6e6', showgrid=True, title_text='Customer LTV ($)'),
-    yaxis=dict(gridcolor='#e6e6e6', showgrid=True, title_text='Number of Customers'),
-    showlegend=False
+# MySQL only returns bins that hold customers; spread the counts over all 50
+# bins so empty ranges show as gaps, and derive the edges from min and width
+ltv_bin_count = 50
+if ltv_bins.empty:
+    # No customer with a positive LTV: keep the 50 bins, all at zero
+    ltv_min, ltv_bin_width = 0.0, 1.0
+else:
+    ltv_min = float(ltv_bins['min_ltv'].iloc[0])
+    ltv_bin_width = float(ltv_bins['bin_width'].iloc[0])
+ltv_counts = np.bincount(
+    ltv_bins['bin'].to_numpy(dtype=np.int64),
+    weights=ltv_bins['customers'].to_numpy(dtype=np.float64),
+    minlength=ltv_bin_count
+).astype(np.int64)
+ltv_edges = np.linspace(ltv_min, ltv_min + ltv_bin_count * ltv_bin_width, ltv_bin_count + 1)
+ltv_centers = (ltv_edges[:-1] + ltv_edges[1:]) * 0.5
+
+# The trace and layout are assembled as plain, fully nested dicts and passed
+# in one go with validation off, so plotly skips its per-property schema
+# checks for this figure
+fig_ltv = go.Figure(
+    data=[dict(
+        type='bar',
+        x=ltv_centers,
+        y=ltv_counts,
+        width=ltv_bin_width,
+        marker=dict(color='#0066cc', line=dict(color='white', width=1)),
+        hovertemplate='Customer LTV ($): %{x:,.0f}<br>Customers: %{y}<extra></extra>'
+    )],
+    layout=dict(
+        title=dict(text='Customer Lifetime Value Distribution'),
+        height=500,
+        xaxis=dict(title=dict(text='Customer LTV ($)')),
+        yaxis=dict(title=dict(text='Number of Customers')),
+        bargap=0,
+        showlegend=False
+    ),
+    _validate=False
 )
 
-fig_ltv.update_traces(marker_line=dict(color='white', width=1))
-
 # ============================================================================
 # Generate HTML Dashboard
 # ============================================================================
 
 print("\nCombining charts into professional dashboard...")
 
-html_content = f"""
+# Pin plotly.js to the version bundled with the installed plotly package so
+# the browser can cache it across report runs. The full bundle is needed:
+# no partial bundle has both pie and scattergl traces
+plotly_js_url = f"https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"
+
+# Serialize figures through plotly's orjson engine, which encodes the numpy
+# trace arrays in C instead of walking them with the json module
+pio.json.config.default_engine = 'orjson'
+
+html_head = f"""
 <!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="utf-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>E-Commerce Analytics Dashboard</title>
-    <script src="https://cdn.plot.ly/plotly-latest.min.js"></script>
+    <script src="{plotly_js_url}" charset="utf-8"></script>
     <style>
         * {{
             margin: 0;
@@ -563,40 +693,51 @@ html_content = f"""
     
     <script>
         const charts = [
-            {fig_rfm.to_json()},
-            {fig_products.to_json()},
-            {fig_country.to_json()},
-            {fig_monthly.to_json()},
-            {fig_price.to_json()},
-            {fig_ltv.to_json()}
-        ];
+"""
+
+html_tail = """        ];
         
         const chartDivs = ['chart1', 'chart2', 'chart3', 'chart4', 'chart5', 'chart6'];
         
-        for (let i = 0; i < charts.length; i++) {{
-            Plotly.newPlot(chartDivs[i], charts[i].data, charts[i].layout, {{
+        for (let i = 0; i < charts.length; i++) {
+            Plotly.newPlot(chartDivs[i], charts[i].data, charts[i].layout, {
                 responsive: true,
                 displayModeBar: true,
                 displaylogo: false,
                 modeBarButtonsToRemove: ['toImage']
-            }});
-        }}
+            });
+        }
     </script>
 </body>
 </html>
 """
 
-with open('visualization_report_v1_corporate_blue.html', 'w', encoding='utf-8') as f:
-    f.write(html_content)
+# Stream the page straight to disk: each figure's JSON is written and
+# released before the next one is serialized
+figures = [fig_rfm, fig_products, fig_country, fig_monthly, fig_price, fig_ltv]
+
+report_path = 'visualization_report_v1_corporate_blue.html'
+
+with open(report_path, 'w', encoding='utf-8') as f:
+    f.write(html_head)
+    for i, fig in enumerate(figures):
+        f.write("            ")
+        f.write(fig.to_json())
+        f.write(",\n" if i < len(figures) - 1 else "\n")
+    f.write(html_tail)
+
+# Precompressed sibling for static hosting (served with Content-Encoding: gzip)
+with open(report_path, 'rb') as src, gzip.open(report_path + '.gz', 'wb', compresslevel=9) as dst:
+    shutil.copyfileobj(src, dst)
 
 print("\n" + "=" * 80)
 print("✓ VERSION A COMPLETED!")
 print("=" * 80)
-print("\nOutput: visualization_report_v1_corporate_blue.html")
+print("\nOutput: visualization_report_v1_corporate_blue.html (+ .gz)")
 print("\nStyle: Corporate Blue (Professional Business)")
 print("  • Color: Traditional corporate blue (#003f87, #0066cc)")
 print("  • Font: Segoe UI, professional sans-serif")
 print("  • Layout: Clean grid with borders and shadows")
 print("  • Best for: Traditional business, finance, enterprise")
 
-conn.close()
+engine.dispose()